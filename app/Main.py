@@ -1,6 +1,7 @@
 """AI Playlist Mood Matcher - Streamlit App (with RAG)"""
 
 import os
+from dataclasses import asdict
 import streamlit as st
 from dotenv import load_dotenv
 
@@ -116,7 +117,7 @@ def main():
         # Parse mood
         mood_profile = mood_parser.parse(mood_input)
         with st.expander("🔍 Mood Analysis"):
-            st.json(mood_profile.__dict__)
+            st.json(asdict(mood_profile))
 
         # Retrieve
         with st.spinner("🔎 Retrieving candidate songs..."):
@@ -2,7 +2,7 @@
 """Core functionality for mood analysis and track processing"""
 
 from .mood import MoodParser, MoodProfile
-from .fetcher import SpotifyDatasetFetcher, Track
+from .fetcher import SpotifyDatasetFetcher, Track, TrackStore
 from .rank import PlaylistRanker, RankedTrack
 
 __all__ = [
@@ -10,6 +10,7 @@ __all__ = [
     "MoodProfile",
     "SpotifyDatasetFetcher",
     "Track",
+    "TrackStore",
     "PlaylistRanker",
     "RankedTrack"
 ]
\ No newline at end of file
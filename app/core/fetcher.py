@@ -1,11 +1,29 @@
 """Spotify dataset loader (used mainly for index building)"""
 
+import os
+import tempfile
+from pathlib import Path
 from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+import numpy as np
+import pandas as pd
 from datasets import load_dataset
+from app import jsonio
 
+# Bump when the Track record layout changes so stale caches are ignored
+_CACHE_VERSION = 4
 
-@dataclass
+# Dataset columns read by _normalize (the rest are never materialized)
+_COLUMNS = (
+    "track_name", "track_artist", "playlist_genre", "playlist_subgenre",
+    "track_album_release_date", "energy", "valence", "danceability", "tempo",
+)
+
+# Integer codes for tempo buckets (-1 = unknown) used by columnar scoring
+TEMPO_CODES = {"slow": 0, "medium": 1, "fast": 2}
+
+
+@dataclass(slots=True)
 class Track:
     title: str
     artist: str
@@ -13,64 +31,156 @@ class Track:
     decade: Optional[str] = None
     tempo: Optional[str] = None
     tags: List[str] = field(default_factory=list)
-    features: Dict[str, Any] = field(default_factory=dict)
+    energy: float = 0.5
+    valence: float = 0.5
+    danceability: float = 0.5
+    tempo_bpm: float = 120.0
+    genre_lc: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Lowercased once here so scoring never calls .lower() per request
+        self.genre_lc = self.genre.lower() if self.genre else ""
+
+
+def _track_record(track: Track) -> Dict[str, Any]:
+    """Constructor arguments of a Track (derived fields are rebuilt on load)"""
+    return {f.name: getattr(track, f.name) for f in fields(track) if f.init}
+
+
+@dataclass
+class TrackStore:
+    """Columnar (one array per feature) view over a list of tracks"""
+    tracks: List[Track]
+    energy: np.ndarray
+    valence: np.ndarray
+    tempo_idx: np.ndarray
+    genre_lc: np.ndarray
+
+    @classmethod
+    def from_tracks(cls, tracks: List[Track]) -> "TrackStore":
+        n = len(tracks)
+        return cls(
+            tracks=tracks,
+            # float64, not float32: 0.6 must not round up past the scoring thresholds
+            energy=np.fromiter((t.energy for t in tracks), dtype=np.float64, count=n),
+            valence=np.fromiter((t.valence for t in tracks), dtype=np.float64, count=n),
+            tempo_idx=np.fromiter((TEMPO_CODES.get(t.tempo, -1) for t in tracks), dtype=np.int8, count=n),
+            genre_lc=np.array([t.genre_lc for t in tracks], dtype=object),
+        )
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def row(self, i: int) -> Track:
+        return self.tracks[i]
 
 
 class SpotifyDatasetFetcher:
     """Fetch dataset from Hugging Face Hub"""
 
-    def __init__(self, dataset_name: str = "maharshipandya/spotify-tracks-dataset"):
+    def __init__(
+        self,
+        dataset_name: str = "maharshipandya/spotify-tracks-dataset",
+        cache_dir: Optional[str] = "data/cache",
+    ):
         self.dataset_name = dataset_name
+        self.cache_dir = Path(cache_dir) if cache_dir else None
         self._dataset = None
 
     def load_tracks(self, n_samples: Optional[int] = None, seed: int = 42) -> List[Track]:
+        cache_file = self._cache_file(n_samples, seed)
+        if cache_file and cache_file.exists():
+            try:
+                return [Track(**record) for record in jsonio.loads(cache_file.read_bytes())]
+            except (OSError, ValueError, TypeError):
+                pass  # unreadable or corrupt cache, rebuild and overwrite it
+
+        tracks = self._normalize(self._sample_frame(n_samples, seed))
+        if cache_file:
+            self._write_cache(cache_file, tracks)
+
+        return tracks
+
+    @staticmethod
+    def _write_cache(cache_file: Path, tracks: List[Track]) -> None:
+        """Best-effort atomic write: readers see the old file or the full new one"""
+        data = jsonio.dumps([_track_record(t) for t in tracks])
+        tmp_file = None
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=cache_file.parent, prefix=f".{cache_file.name}.", suffix=".tmp")
+            tmp_file = Path(tmp_name)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            if tmp_file is not None:
+                tmp_file.unlink(missing_ok=True)
+
+    def _cache_file(self, n_samples: Optional[int], seed: int) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        slug = self.dataset_name.replace("/", "__")
+        return self.cache_dir / slug / f"tracks_v{_CACHE_VERSION}_{n_samples or 'all'}_{seed}.json"
+
+    def _sample_frame(self, n_samples: Optional[int], seed: int) -> pd.DataFrame:
         if self._dataset is None:
-            self._dataset = load_dataset(self.dataset_name, split="train")
+            ds = load_dataset(self.dataset_name, split="train")
+            self._dataset = ds.select_columns([c for c in _COLUMNS if c in ds.column_names])
 
-        df = self._dataset.to_pandas()
+        ds = self._dataset
         if n_samples:
-            df = df.sample(n=n_samples, random_state=seed)
-
-        tracks: List[Track] = []
-        for _, row in df.iterrows():
-            # Basic cleanup
-            title = str(row.get("track_name", "")).strip() or "Unknown"
-            artist = str(row.get("track_artist", "")).strip() or "Unknown"
-            genre = str(row.get("playlist_genre", "")).strip() or None
-            subgenre = str(row.get("playlist_subgenre", "")).strip() or None
-
-            # decade from release year
-            decade = None
-            try:
-                year = int(str(row.get("track_album_release_date", ""))[:4])
-                if year > 0:
-                    decade = f"{(year // 10) * 10}s"
-            except Exception:
-                pass
-
-            features = {
-                "energy": float(row.get("energy", 0.5)),
-                "valence": float(row.get("valence", 0.5)),
-                "danceability": float(row.get("danceability", 0.5)),
-                "tempo_val": float(row.get("tempo", 120.0)),
-            }
-
-            tempo = (
-                "slow" if features["tempo_val"] < 90 else
-                "medium" if features["tempo_val"] < 140 else
-                "fast"
-            )
+            # Convert only the sampled rows instead of the whole split
+            rng = np.random.default_rng(seed)
+            ds = ds.select(np.sort(rng.choice(ds.num_rows, size=n_samples, replace=False)))
+        return ds.to_pandas()
+
+    def _normalize(self, df: pd.DataFrame) -> List[Track]:
+        """Clean and derive all columns at once, then build Tracks in one pass"""
+        # Basic cleanup
+        title = self._text(df, "track_name").replace("", "Unknown")
+        artist = self._text(df, "track_artist").replace("", "Unknown")
+        genre = self._text(df, "playlist_genre")
+        subgenre = self._text(df, "playlist_subgenre")
+
+        # decade from release year
+        year_str = self._text(df, "track_album_release_date").str.slice(0, 4)
+        year = pd.to_numeric(year_str.where(year_str.str.isdigit()), errors="coerce")
+        decade = (year // 10 * 10).astype("Int64").astype(str).add("s").astype(object).where(year > 0, None)
 
-            tracks.append(
-                Track(
-                    title=title,
-                    artist=artist,
-                    genre=genre or subgenre or "unknown",
-                    decade=decade,
-                    tempo=tempo,
-                    tags=[g for g in [genre, subgenre] if g],
-                    features=features,
-                )
+        energy = self._num(df, "energy", 0.5)
+        valence = self._num(df, "valence", 0.5)
+        danceability = self._num(df, "danceability", 0.5)
+        tempo_val = self._num(df, "tempo", 120.0)
+        tempo = pd.cut(
+            tempo_val, bins=[-np.inf, 90, 140, np.inf], labels=["slow", "medium", "fast"], right=False
+        ).astype(object)
+
+        columns = zip(title, artist, genre, subgenre, decade, tempo, energy, valence, danceability, tempo_val)
+        return [
+            Track(
+                title=t,
+                artist=a,
+                genre=g or sg or "unknown",
+                decade=dec,
+                tempo=tmp,
+                tags=[x for x in [g, sg] if x],
+                energy=e,
+                valence=v,
+                danceability=d,
+                tempo_bpm=tv,
             )
+            for t, a, g, sg, dec, tmp, e, v, d, tv in columns
+        ]
 
-        return tracks
+    @staticmethod
+    def _text(df: pd.DataFrame, col: str) -> pd.Series:
+        if col not in df:
+            return pd.Series("", index=df.index, dtype=object)
+        return df[col].fillna("").astype(str).str.strip()
+
+    @staticmethod
+    def _num(df: pd.DataFrame, col: str, default: float) -> pd.Series:
+        if col not in df:
+            return pd.Series(default, index=df.index, dtype=float)
+        return pd.to_numeric(df[col], errors="coerce").fillna(default)
@@ -1,17 +1,23 @@
 """Mood parsing and analysis for playlist matching"""
 
+import functools
 import re
+import string
 from dataclasses import dataclass
-from typing import List, Set
+from typing import Dict, FrozenSet, Set, Tuple
 
+# Punctuation (except "_", a word character for the regex) becomes whitespace
+_PUNCT_TABLE = str.maketrans(dict.fromkeys(string.punctuation.replace("_", ""), " "))
+_WORD_RE = re.compile(r"\b[a-z]+\b")
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class MoodProfile:
     energy: str      # low / medium / high
     valence: str     # negative / neutral / positive
     tempo: str       # slow / medium / fast
-    genres: List[str]
-    keywords: List[str]
+    genres: Tuple[str, ...]
+    keywords: Tuple[str, ...]
     raw_text: str
 
 
@@ -19,47 +25,55 @@ class MoodParser:
     """Parse user mood text into structured attributes"""
 
     ENERGY_MAP = {
-        "high": ["energetic", "excited", "upbeat", "powerful"],
-        "medium": ["calm", "balanced", "relaxed"],
-        "low": ["tired", "sleepy", "chill", "mellow"]
+        "high": frozenset({"energetic", "excited", "upbeat", "powerful"}),
+        "medium": frozenset({"calm", "balanced", "relaxed"}),
+        "low": frozenset({"tired", "sleepy", "chill", "mellow"})
     }
 
     VALENCE_MAP = {
-        "positive": ["happy", "joyful", "bright", "uplifting"],
-        "negative": ["sad", "dark", "gloomy", "angry"],
-        "neutral": ["nostalgic", "bittersweet", "reflective"]
+        "positive": frozenset({"happy", "joyful", "bright", "uplifting"}),
+        "negative": frozenset({"sad", "dark", "gloomy", "angry"}),
+        "neutral": frozenset({"nostalgic", "bittersweet", "reflective"})
     }
 
     TEMPO_MAP = {
-        "fast": ["fast", "quick", "danceable"],
-        "medium": ["steady", "moderate"],
-        "slow": ["slow", "ballad", "peaceful"]
+        "fast": frozenset({"fast", "quick", "danceable"}),
+        "medium": frozenset({"steady", "moderate"}),
+        "slow": frozenset({"slow", "ballad", "peaceful"})
     }
 
-    GENRE_KEYWORDS = {
+    GENRE_KEYWORDS = frozenset({
         "rock", "pop", "hip-hop", "rap", "jazz", "classical",
         "electronic", "country", "folk", "blues", "reggae",
         "metal", "punk", "indie", "r&b", "soul"
-    }
+    })
 
+    # Parsing is deterministic over the text and repeat submissions are common.
+    # Parsers live for the whole app session, so pinning self is harmless.
+    @functools.lru_cache(maxsize=256)  # noqa: B019
     def parse(self, mood_text: str) -> MoodProfile:
         if not mood_text.strip():
-            return MoodProfile("medium", "neutral", "medium", [], [], "")
+            return MoodProfile("medium", "neutral", "medium", (), (), "")
 
-        text = mood_text.lower()
-        words = set(re.findall(r"\b[a-z]+\b", text))
+        words = self._extract_words(mood_text.lower())
 
         return MoodProfile(
             energy=self._detect(words, self.ENERGY_MAP, "medium"),
             valence=self._detect(words, self.VALENCE_MAP, "neutral"),
             tempo=self._detect(words, self.TEMPO_MAP, "medium"),
-            genres=[g for g in words if g in self.GENRE_KEYWORDS],
-            keywords=list(words),
+            genres=tuple(words & self.GENRE_KEYWORDS),
+            keywords=tuple(words),
             raw_text=mood_text.strip()
         )
 
-    def _detect(self, words: Set[str], mapping, default: str) -> str:
+    def _extract_words(self, text: str) -> Set[str]:
+        if not text.isascii():
+            return set(_WORD_RE.findall(text))
+        # Same tokens as the regex for ASCII input, without the regex engine
+        return {w for w in text.translate(_PUNCT_TABLE).split() if w.isalpha()}
+
+    def _detect(self, words: Set[str], mapping: Dict[str, FrozenSet[str]], default: str) -> str:
         for k, kws in mapping.items():
-            if any(w in words for w in kws):
+            if not kws.isdisjoint(words):
                 return k
         return default
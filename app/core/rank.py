@@ -1,18 +1,85 @@
 """Ranking + AI explanations for retrieved tracks"""
 
-from typing import List, Dict, Any, Optional
+import heapq
+import math
+from typing import List, Dict, Any, Sequence, Tuple
 from dataclasses import dataclass
+import numpy as np
 from app.core.mood import MoodProfile
-from app.core.fetcher import Track
+from app.core.fetcher import TEMPO_CODES, Track, TrackStore
 from app.services.models import ModelManager, ModelResponse
 
+try:
+    from numba import njit
+except ImportError:  # optional, the NumPy kernel is used instead
+    njit = None
 
-@dataclass
+
+def _score_kernel_numpy(
+    energy: np.ndarray,
+    valence: np.ndarray,
+    tempo_idx: np.ndarray,
+    genre_match: np.ndarray,
+    high_energy: bool,
+    positive: bool,
+    mood_tempo_idx: int,
+) -> np.ndarray:
+    scores = np.full(len(energy), 5.0, dtype=np.float32)
+    if high_energy:
+        scores += energy > 0.7
+    if positive:
+        scores += valence > 0.6
+    scores += tempo_idx == mood_tempo_idx
+    scores += genre_match
+    return np.clip(scores, 0, 10)
+
+
+def _score_kernel_loop(
+    energy: np.ndarray,
+    valence: np.ndarray,
+    tempo_idx: np.ndarray,
+    genre_match: np.ndarray,
+    high_energy: bool,
+    positive: bool,
+    mood_tempo_idx: int,
+) -> np.ndarray:
+    scores = np.empty(energy.shape[0], dtype=np.float32)
+    for i in range(energy.shape[0]):
+        s = 5.0
+        if high_energy and energy[i] > 0.7:
+            s += 1.0
+        if positive and valence[i] > 0.6:
+            s += 1.0
+        if tempo_idx[i] == mood_tempo_idx:
+            s += 1.0
+        if genre_match[i]:
+            s += 1.0
+        scores[i] = min(max(s, 0.0), 10.0)
+    return scores
+
+
+# Compiled once per process (and cached to __pycache__ across processes)
+_score_kernel = njit(cache=True, fastmath=True)(_score_kernel_loop) if njit else _score_kernel_numpy
+
+# Base-score gap at the top_k boundary below which the AI may re-rank across it
+_OVERFETCH_MARGIN = 0.3
+
+# Songs per AI prompt (prompts are sent concurrently by the model manager)
+_AI_BATCH_SIZE = 5
+
+# Shared immutable defaults, so fallbacks don't allocate per track
+_FALLBACK_REASON = "Feature-based match"
+_FALLBACK_FACTORS = ("tempo", "energy")
+_DEFAULT_AI_REASON = "Matches your mood"
+_DEFAULT_AI_FACTORS = ("compatibility",)
+
+
+@dataclass(slots=True)
 class RankedTrack:
     track: Track
     score: float
     reason: str
-    match_factors: List[str]
+    match_factors: Sequence[str]
 
 
 class PlaylistRanker:
@@ -20,51 +87,102 @@ class PlaylistRanker:
         self.model_manager = model_manager
 
     def rank_and_explain(self, mood: MoodProfile, tracks: List[Track], top_k: int = 10) -> List[RankedTrack]:
-        ranked = []
-        for t in tracks:
-            base_score = self._calculate_score(mood, t)
-            ai_ranking = self._get_ai_ranking(mood, t, base_score)
-            ranked.append(ai_ranking or self._fallback(t, base_score))
-
-        ranked.sort(key=lambda r: r.score, reverse=True)
-        return ranked[:top_k]
-
-    def _calculate_score(self, mood: MoodProfile, track: Track) -> float:
-        score = 5.0
-        if mood.energy == "high" and track.features.get("energy", 0.5) > 0.7:
-            score += 1
-        if mood.valence == "positive" and track.features.get("valence", 0.5) > 0.6:
-            score += 1
-        if mood.tempo == track.tempo:
-            score += 1
-        if mood.genres and track.genre and track.genre.lower() in [g.lower() for g in mood.genres]:
-            score += 1
-        return max(0, min(10, score))
-
-    def _get_ai_ranking(self, mood: MoodProfile, track: Track, base: float) -> Optional[RankedTrack]:
-        prompt = f"""
+        store = TrackStore.from_tracks(tracks)
+        base_scores = self._calculate_scores(mood, store)
+
+        # Partial selection: at most 2 * top_k candidates can ever reach the AI
+        scored = heapq.nlargest(2 * top_k, zip(store.tracks, base_scores.tolist()), key=lambda c: c[1])
+        candidates = scored[:self._candidate_pool_size(scored, top_k)]
+        ranked = self._get_ai_rankings(mood, candidates)
+
+        return heapq.nlargest(top_k, ranked, key=lambda r: r.score)
+
+    def _candidate_pool_size(self, scored: List[Tuple[Track, float]], top_k: int) -> int:
+        """Only over-fetch for the AI when the top_k cut-off is a near tie"""
+        if 0 < top_k < len(scored) and scored[top_k - 1][1] - scored[top_k][1] < _OVERFETCH_MARGIN:
+            return top_k * 2
+        return top_k
+
+    def _calculate_scores(self, mood: MoodProfile, store: TrackStore) -> np.ndarray:
+        if mood.genres:
+            genre_match = np.isin(store.genre_lc, [g.lower() for g in mood.genres])
+        else:
+            genre_match = np.zeros(len(store), dtype=np.bool_)
+        return _score_kernel(
+            store.energy,
+            store.valence,
+            store.tempo_idx,
+            genre_match,
+            mood.energy == "high",
+            mood.valence == "positive",
+            TEMPO_CODES.get(mood.tempo, -2),
+        )
+
+    def _get_ai_rankings(self, mood: MoodProfile, candidates: List[Tuple[Track, float]]) -> List[RankedTrack]:
+        """Rank candidates in small batched prompts issued concurrently"""
+        chunks = [candidates[i:i + _AI_BATCH_SIZE] for i in range(0, len(candidates), _AI_BATCH_SIZE)]
+        responses: List[ModelResponse] = self.model_manager.generate_json_batch(
+            [self._build_batch_prompt(mood, chunk) for chunk in chunks], temperature=0.3
+        )
+
+        ranked: List[RankedTrack] = []
+        for chunk, resp in zip(chunks, responses):
+            entries = resp.data.get("rankings") if resp.success else None
+            ranked.extend(self._parse_ai_batch(entries, chunk))
+        return ranked
+
+    def _build_batch_prompt(self, mood: MoodProfile, candidates: List[Tuple[Track, float]]) -> str:
+        songs = "\n        ".join(
+            f"{i}. {t.title} by {t.artist}, genre={t.genre}, tempo={t.tempo}, base score={base:.1f}"
+            for i, (t, base) in enumerate(candidates)
+        )
+        return f"""
         User mood: {mood.raw_text}
-        Song: {track.title} by {track.artist}, genre={track.genre}, tempo={track.tempo}
-        Base score: {base:.1f}
+        Songs:
+        {songs}
 
-        Respond JSON only:
+        Respond JSON only, one entry per song ({len(candidates)} entries):
         {{
-          "score": <float 0-10>,
-          "reason": "<short explanation>",
-          "factors": ["energy", "genre"]
+          "rankings": [
+            {{"index": <song number>, "score": <float 0-10>, "reason": "<short explanation>", "factors": ["energy", "genre"]}}
+          ]
         }}
         """
-        resp: ModelResponse = self.model_manager.generate_json(prompt, temperature=0.3)
-        if not resp.success:
-            return None
 
-        data = resp.data
+    def _parse_ai_batch(self, entries: Any, candidates: List[Tuple[Track, float]]) -> List[RankedTrack]:
+        """Map model entries back to candidates by index, falling back per track"""
+        by_index: Dict[int, Dict[str, Any]] = {}
+        if isinstance(entries, list):
+            for pos, entry in enumerate(entries):
+                if isinstance(entry, dict):
+                    idx = entry.get("index", pos)
+                    by_index.setdefault(idx if isinstance(idx, int) else pos, entry)
+
+        ranked = []
+        for i, (track, base) in enumerate(candidates):
+            entry = by_index.get(i)
+            ranked.append(self._parse_ai_entry(entry, track, base) if entry else self._fallback(track, base))
+        return ranked
+
+    def _parse_ai_entry(self, entry: Dict[str, Any], track: Track, base: float) -> RankedTrack:
+        """Parse and validate one model entry in a single pass"""
+        try:
+            score = float(entry.get("score", base))
+        except (TypeError, ValueError):
+            return self._fallback(track, base)
+        if math.isnan(score):
+            return self._fallback(track, base)
+
+        factors = entry.get("factors")
+        if not isinstance(factors, list) or not all(isinstance(f, str) for f in factors):
+            factors = _DEFAULT_AI_FACTORS
+
         return RankedTrack(
             track=track,
-            score=float(data.get("score", base)),
-            reason=str(data.get("reason", "Matches your mood")),
-            match_factors=data.get("factors", ["compatibility"])
+            score=min(max(score, 0.0), 10.0),
+            reason=str(entry.get("reason", _DEFAULT_AI_REASON)),
+            match_factors=factors
         )
 
     def _fallback(self, track: Track, base: float) -> RankedTrack:
-        return RankedTrack(track=track, score=base, reason="Feature-based match", match_factors=["tempo", "energy"])
+        return RankedTrack(track=track, score=base, reason=_FALLBACK_REASON, match_factors=_FALLBACK_FACTORS)
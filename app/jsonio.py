@@ -0,0 +1,20 @@
+"""JSON encoding shared by the dataset cache and the model clients"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json is the fallback
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode to UTF-8 JSON bytes"""
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Decode JSON from str or bytes"""
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch the latter
+    return orjson.loads(data) if orjson else json.loads(data)
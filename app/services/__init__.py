@@ -7,6 +7,7 @@ from .models import (
     HuggingFaceClient,
     OllamaClient,
     ModelResponse,
+    close_all_sessions,
 )
 
 __all__ = [
@@ -16,4 +17,5 @@ __all__ = [
     "HuggingFaceClient",
     "OllamaClient",
     "ModelResponse",
+    "close_all_sessions",
 ]
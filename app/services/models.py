@@ -1,89 +1,499 @@
 """Model client management for AI playlist ranking"""
 
-from typing import Any, Dict, Optional
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Protocol, Tuple
+from urllib.parse import urlsplit
 
+from app import jsonio
 
+if TYPE_CHECKING:
+    # requests (urllib3, certifi, charset detection...) is imported on first
+    # client construction, not when this module is imported
+    import requests
+
+try:
+    import ijson
+except ImportError:  # optional, HF responses are then parsed in full
+    ijson = None
+
+# Pooled sessions keyed by (scheme://host, retry statuses, honor Retry-After), see _get_session
+_SESSIONS: Dict[Tuple[str, Tuple[int, ...], bool], "requests.Session"] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# Parse errors raised while reading a streamed body
+_STREAM_ERRORS = (ijson.JSONError,) if ijson else ()
+
+# Last-resort "key: value" patterns for model output that isn't JSON
+_KV_PATTERNS = (
+    ("score", re.compile(r"score[:\s]+(\d+\.?\d*)", re.IGNORECASE)),
+    ("rating", re.compile(r"rating[:\s]+(\d+\.?\d*)", re.IGNORECASE)),
+    ("reason", re.compile(r'reason[:\s]+"([^"]+)"', re.IGNORECASE)),
+    ("explanation", re.compile(r'explanation[:\s]+"([^"]+)"', re.IGNORECASE)),
+    ("match", re.compile(r"match[:\s]+(\d+\.?\d*)", re.IGNORECASE)),
+)
+
+# Markdown fence models wrap JSON in, and the language tags allowed after it
+_FENCE = "```"
+_FENCE_LANGS = ("json", "JSON")
+
+# Fallback scans (fences, braces, key/value patterns) only see this much output,
+# so their cost stays bounded on runaway generations
+_MAX_SCAN_CHARS = 64 * 1024
+
+
+@dataclass(slots=True, frozen=True)
 class ModelResponse:
     """Standardized response from AI models"""
+    success: bool
+    data: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def ensure_json(text: str) -> Optional[Dict[str, Any]]:
+    """Extract a JSON object from free-form model output"""
+    text = text.strip()
+    data = None
+    # Only text that starts like JSON is worth a direct parse (saves a raise/catch)
+    if text[:1] in ("{", "["):
+        try:
+            data = jsonio.loads(text)
+        except json.JSONDecodeError:
+            pass
+    if isinstance(data, dict):
+        return data
+
+    text = text[:_MAX_SCAN_CHARS]
+    data = _parse_fenced(text)
+    if not isinstance(data, dict):
+        data = _parse_braces(text)
+    if isinstance(data, dict):
+        return data
+    return _extract_key_value_pairs(text) or None
+
+
+def _parse_fenced(text: str) -> Any:
+    """JSON object from the first markdown code fence holding one"""
+    # str.find/partition keep this linear; a lazy DOTALL regex rescans per fence
+    _, fence, rest = text.partition(_FENCE)
+    while fence:
+        body, fence, rest = rest.partition(_FENCE)
+        if not fence:
+            break
+        for lang in _FENCE_LANGS:
+            if body.startswith(lang):
+                body = body[len(lang):]
+                break
+        body = body.strip()
+        if body[:1] == "{":
+            data = _try_loads(body)
+            if data is not None:
+                return data
+        # Skip past the closing fence to the next opening one
+        _, fence, rest = rest.partition(_FENCE)
+    return None
+
+
+def _parse_braces(text: str) -> Any:
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    return _try_loads(text[start:end + 1])
+
+
+def _try_loads(text: str) -> Any:
+    try:
+        return jsonio.loads(text)
+    except json.JSONDecodeError:
+        return None
 
-    def __init__(self, success: bool, data: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
-        self.success = success
-        self.data = data or {}
-        self.error = error
 
+def _extract_key_value_pairs(text: str) -> Dict[str, Any]:
+    text = text[:_MAX_SCAN_CHARS]
+    result: Dict[str, Any] = {}
+    for key, pattern in _KV_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            try:
+                result[key] = float(match.group(1))
+            except ValueError:
+                result[key] = match.group(1)
+    return result
 
-class BaseModelClient:
-    """Base class for model clients"""
+
+def _json_response(text: str) -> ModelResponse:
+    data = ensure_json(text)
+    if data is None:
+        return ModelResponse(success=False, error="Model output was not valid JSON")
+    return ModelResponse(success=True, data=data)
+
+
+def _get_session(
+    url: str,
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504),
+    respect_retry_after: bool = True,
+) -> "requests.Session":
+    """Process-wide session per host (and retry policy), so keep-alive survives client re-creation"""
+    parts = urlsplit(url)
+    key = (f"{parts.scheme}://{parts.netloc}", retry_statuses, respect_retry_after)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = _SESSIONS[key] = _build_session(retry_statuses, respect_retry_after)
+        return session
+
+
+def close_all_sessions() -> None:
+    """Close every pooled session (for graceful shutdown hooks)"""
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+
+
+def _build_session(retry_statuses: Tuple[int, ...], respect_retry_after: bool = True) -> "requests.Session":
+    """Keep-alive session with pooled connections and retries on transient errors"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    # Bodies are pre-encoded (orjson when available) and sent as data=
+    session.headers["Content-Type"] = "application/json"
+
+    retry = Retry(
+        total=3,
+        # A read timeout means the server may still be generating; replaying
+        # the POST would only queue another generation behind it
+        read=0,
+        backoff_factor=0.2,
+        status_forcelist=retry_statuses,
+        # When off, a 429 Retry-After can't stall the caller for minutes
+        respect_retry_after_header=respect_retry_after,
+        allowed_methods=frozenset({"POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class BaseModelClient(Protocol):
+    """Interface model clients implement (structural, no inheritance needed)"""
 
     def generate_json(self, prompt: str, temperature: float = 0.7, max_length: int = 256) -> ModelResponse:
-        raise NotImplementedError
+        ...
 
 
-class HuggingFaceClient(BaseModelClient):
+class HuggingFaceClient:
     """Client for Hugging Face models"""
 
-    def __init__(self, model_name: str):
+    API_URL = "https://api-inference.huggingface.co/models/"
+    TIMEOUT = 30.0
+    # Longest we wait for a cold model to load before the single retry
+    MAX_LOADING_WAIT = 20.0
+
+    def __init__(self, model_name: str, api_token: Optional[str] = None):
         self.model_name = model_name
-        # In production, you’d configure API access here.
+        self.base_url = f"{self.API_URL}{model_name}"
+        token = api_token or os.getenv("HUGGINGFACE_API_TOKEN")
+        self.headers = MappingProxyType({"Authorization": f"Bearer {token}"} if token else {})
+        # 503 means "model loading" here and is retried in _post with the
+        # server's estimate rather than urllib3's short backoff. Other retries
+        # use the short backoff only, never a server-chosen Retry-After.
+        self.session = _get_session(self.base_url, retry_statuses=(429, 500, 502, 504), respect_retry_after=False)
+        # The session is shared across clients, so auth travels with each request
+        self._send = functools.partial(self.session.post, self.base_url, headers=self.headers)
 
     def generate_json(self, prompt: str, temperature: float = 0.7, max_length: int = 256) -> ModelResponse:
-        # TODO: Replace with actual Hugging Face API call
-        # Mock implementation for demo
-        return ModelResponse(
-            success=True,
-            data={
-                "score": 7.5,
-                "reason": "Good match for your mood",
-                "factors": ["tempo", "energy"]
-            }
-        )
-
-
-class OllamaClient(BaseModelClient):
+        if ijson is not None:
+            # Pull the first generated_text straight off the socket
+            text, error = self._post(prompt, temperature, max_length, read=_first_generated_text)
+            if error is not None:
+                return ModelResponse(success=False, error=error)
+            if text is None:
+                return ModelResponse(success=False, error="Response had no generated_text")
+            return _json_response(text)
+
+        body, error = self._post(prompt, temperature, max_length)
+        if error is not None:
+            return ModelResponse(success=False, error=error)
+        return self._parse_generation(body)
+
+    def generate_many(self, prompts: List[str], temperature: float = 0.7, max_length: int = 256) -> List[ModelResponse]:
+        """Generate for several prompts in one request (HF accepts a list of inputs)"""
+        body, error = self._post(list(prompts), temperature, max_length)
+        if error is None and not (isinstance(body, list) and len(body) == len(prompts)):
+            error = f"Unexpected response: {body!r}"
+        if error is not None:
+            return [ModelResponse(success=False, error=error) for _ in prompts]
+        return [self._parse_generation(item) for item in body]
+
+    def _post(
+        self,
+        inputs: Any,
+        temperature: float,
+        max_length: int,
+        read: Optional[Callable[["requests.Response"], Any]] = None,
+    ) -> Tuple[Any, Optional[str]]:
+        """POST to the model; `read` consumes a streamed body instead of buffering it"""
+        # Reading response.raw directly (ijson) skips requests' exception wrapping
+        from urllib3.exceptions import HTTPError as Urllib3Error
+
+        payload = {
+            "inputs": inputs,
+            "parameters": {
+                "temperature": temperature,
+                "max_new_tokens": max_length,
+                "return_full_text": False,
+            },
+        }
+        body = jsonio.dumps(payload)
+        # The deadline only bounds the 503 wait and its retry. timeout= is a
+        # per-connect/read limit, and urllib3's own retries run inside _send.
+        deadline = time.monotonic() + self.TIMEOUT
+        stream = read is not None
+        try:
+            response = self._send(data=body, timeout=self.TIMEOUT, stream=stream)
+            if response.status_code == 503:
+                wait = self._loading_wait(response)
+                if deadline - time.monotonic() > wait:
+                    time.sleep(wait)
+                    response = self._send(data=body, timeout=deadline - time.monotonic(), stream=stream)
+            with response:
+                response.raise_for_status()
+                if not stream:
+                    return jsonio.loads(response.content), None
+                result = read(response)
+                # Finish the body so closing returns the connection to the pool
+                while response.raw.read(64 * 1024):
+                    pass
+                return result, None
+        # requests.RequestException subclasses OSError
+        except (OSError, ValueError, Urllib3Error, *_STREAM_ERRORS) as e:
+            return None, str(e)
+
+    def _parse_generation(self, item: Any) -> ModelResponse:
+        # One generation is [{"generated_text": ...}] (or a bare dict inside batches)
+        if isinstance(item, list) and item:
+            item = item[0]
+        if not isinstance(item, dict):
+            return ModelResponse(success=False, error=f"Unexpected response: {item!r}")
+        text = item.get("generated_text")
+        if not isinstance(text, str):
+            return ModelResponse(success=False, error="Response had no generated_text")
+        return _json_response(text)
+
+    def _loading_wait(self, response: "requests.Response") -> float:
+        """Seconds to wait for a cold model, from the 503 body's estimated_time"""
+        try:
+            wait = float(jsonio.loads(response.content).get("estimated_time", 2.0))
+        except (ValueError, TypeError, AttributeError):
+            wait = 2.0
+        return min(max(wait, 0.0), self.MAX_LOADING_WAIT)
+
+
+class OllamaClient:
     """Client for Ollama (local models)"""
 
-    def __init__(self, model_name: str, base_url: str = "http://localhost:11434"):
+    def __init__(self, model_name: str, base_url: Optional[str] = None):
         self.model_name = model_name
-        self.base_url = base_url
-        # In production, you’d connect to Ollama here.
+        self.base_url = (base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")).rstrip("/")
+        self.session = _get_session(self.base_url)
+        self._send = functools.partial(self.session.post, f"{self.base_url}/api/generate", timeout=60, stream=True)
 
-    def generate_json(self, prompt: str, temperature: float = 0.7, max_length: int = 256) -> ModelResponse:
-        # TODO: Replace with actual Ollama API call
-        # Mock implementation for demo
-        return ModelResponse(
-            success=True,
-            data={
-                "score": 8.0,
-                "reason": "Matches well with your described vibe",
-                "factors": ["genre", "mood"]
-            }
-        )
+    def generate_json(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_length: int = 256,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> ModelResponse:
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "format": "json",
+            "stream": True,
+            "options": {"temperature": temperature, "num_predict": max_length},
+        }
+        # Consume NDJSON chunks as they arrive instead of buffering the whole reply
+        parts: List[str] = []
+        try:
+            with self._send(data=jsonio.dumps(payload)) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = jsonio.loads(line)
+                    if "error" in chunk:
+                        return ModelResponse(success=False, error=str(chunk["error"]))
+                    token = chunk.get("response", "")
+                    parts.append(token)
+                    if on_token and token:
+                        on_token(token)
+                # No break on "done": reading to the end of the chunked body
+                # lets the connection go back to the pool instead of being dropped
+        except (OSError, ValueError) as e:  # requests.RequestException subclasses OSError
+            return ModelResponse(success=False, error=str(e))
+
+        return _json_response("".join(parts))
+
+
+def _first_generated_text(response: "requests.Response") -> Optional[str]:
+    response.raw.decode_content = True  # let urllib3 undo gzip before ijson reads
+    return next(ijson.items(response.raw, "item.generated_text"), None)
 
 
 class ModelManager:
     """Manages multiple model clients with fallback"""
 
-    def __init__(self, primary: BaseModelClient, fallback: Optional[BaseModelClient] = None):
+    def __init__(self, primary: BaseModelClient, fallback: Optional[BaseModelClient] = None, cache_size: int = 512):
         self.primary = primary
         self.fallback = fallback
+        # In-process LRU of successful responses; repeated prompts skip the network.
+        # Entries hold encoded JSON, so each hit decodes a fresh, unshared dict.
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
 
     def generate_json(self, prompt: str, temperature: float = 0.7, max_length: int = 256) -> ModelResponse:
+        key = self._cache_key(prompt, temperature, max_length)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        response = self._generate_uncached(prompt, temperature, max_length)
+        self._cache_put(key, response)
+        return response
+
+    def generate_json_batch(
+        self, prompts: List[str], temperature: float = 0.7, max_length: int = 256, max_workers: int = 8
+    ) -> List[ModelResponse]:
+        """Run independent prompts, batched or concurrently; results keep the input order"""
+        generate_many = getattr(self.primary, "generate_many", None)
+        if generate_many is None or len(prompts) <= 1:
+            return self._map_concurrently(
+                lambda p: self._safe_generate(p, temperature, max_length), prompts, max_workers
+            )
+
+        keys = [self._cache_key(p, temperature, max_length) for p in prompts]
+        results: List[Optional[ModelResponse]] = [self._cache_get(k) for k in keys]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if not missing:
+            return results
+
         try:
-            return self.primary.generate_json(prompt, temperature, max_length)
+            batch = generate_many([prompts[i] for i in missing], temperature, max_length)
+        except Exception as e:
+            batch = [ModelResponse(success=False, error=str(e)) for _ in missing]
+        if len(batch) < len(missing):
+            # Slots the client did not answer fail (and go to the fallback) instead of staying None
+            error = f"Batch returned {len(batch)} results for {len(missing)} prompts"
+            batch = list(batch) + [ModelResponse(success=False, error=error)] * (len(missing) - len(batch))
+
+        failed = []
+        for i, response in zip(missing, batch):
+            results[i] = response
+            if response.success:
+                self._cache_put(keys[i], response)
+            else:
+                failed.append(i)
+
+        # Only the items the batched call could not serve go to the fallback client
+        if failed and self.fallback:
+            retried = self._map_concurrently(
+                lambda i: self._safe_fallback(prompts[i], temperature, max_length), failed, max_workers
+            )
+            for i, response in zip(failed, retried):
+                results[i] = response
+                self._cache_put(keys[i], response)
+        return results
+
+    def _map_concurrently(self, fn: Callable[[Any], ModelResponse], items: List[Any], max_workers: int) -> List[ModelResponse]:
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+            return list(pool.map(fn, items))
+
+    def _safe_generate(self, prompt: str, temperature: float, max_length: int) -> ModelResponse:
+        # One failed prompt must not take down the rest of the batch
+        try:
+            return self.generate_json(prompt, temperature, max_length)
         except Exception as e:
-            if self.fallback:
-                return self.fallback.generate_json(prompt, temperature, max_length)
             return ModelResponse(success=False, error=str(e))
 
+    def _safe_fallback(self, prompt: str, temperature: float, max_length: int) -> ModelResponse:
+        try:
+            return self.fallback.generate_json(prompt, temperature, max_length)
+        except Exception as e:
+            return ModelResponse(success=False, error=str(e))
+
+    def invalidate(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return {"hits": self._hits, "misses": self._misses, "size": len(self._cache), "maxsize": self.cache_size}
+
+    def _cache_get(self, key: bytes) -> Optional[ModelResponse]:
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+        return ModelResponse(success=True, data=jsonio.loads(cached))
+
+    def _cache_put(self, key: bytes, response: ModelResponse) -> None:
+        if not response.success or self.cache_size <= 0:
+            return
+        try:
+            encoded = jsonio.dumps(response.data)
+        except (TypeError, ValueError):
+            return  # not JSON-serializable (custom client), leave it uncached
+        with self._cache_lock:
+            self._cache[key] = encoded
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_key(self, prompt: str, temperature: float, max_length: int) -> bytes:
+        raw = f"{id(self.primary)}|{prompt}|{temperature}|{max_length}".encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def _generate_uncached(self, prompt: str, temperature: float, max_length: int) -> ModelResponse:
+        try:
+            response = self.primary.generate_json(prompt, temperature, max_length)
+        except Exception as e:
+            response = ModelResponse(success=False, error=str(e))
+
+        if not response.success and self.fallback:
+            return self.fallback.generate_json(prompt, temperature, max_length)
+        return response
+
 
 class ModelClientFactory:
     """Factory to create model clients by type"""
 
     @staticmethod
-    def create_client(client_type: str, model_name: str) -> BaseModelClient:
+    def create_client(client_type: str, model_name: str, **kwargs: Any) -> BaseModelClient:
         if client_type == "huggingface":
-            return HuggingFaceClient(model_name)
+            return HuggingFaceClient(model_name, **kwargs)
         elif client_type == "ollama":
-            return OllamaClient(model_name)
+            return OllamaClient(model_name, **kwargs)
         else:
-            raise ValueError(f"Unsupported client type: {client_type}")
\ No newline at end of file
+            raise ValueError(f"Unsupported client type: {client_type}")
@@ -0,0 +1,16 @@
+"""Shared test setup"""
+
+import sys
+import types
+
+try:
+    import datasets  # noqa: F401
+except ImportError:
+    # app.core.fetcher imports datasets at module level; tests supply their own data
+    _stub = types.ModuleType("datasets")
+
+    def _load_dataset(*args, **kwargs):
+        raise RuntimeError("datasets is not installed")
+
+    _stub.load_dataset = _load_dataset
+    sys.modules["datasets"] = _stub
@@ -0,0 +1,175 @@
+"""Tests for dataset normalization and the on-disk track cache"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.core import fetcher
+from app.core.fetcher import SpotifyDatasetFetcher, Track, TrackStore
+
+
+class _FakeDataset:
+    """The slice of datasets.Dataset the fetcher uses"""
+
+    def __init__(self, df):
+        self._df = df
+
+    @property
+    def column_names(self):
+        return list(self._df.columns)
+
+    @property
+    def num_rows(self):
+        return len(self._df)
+
+    def select_columns(self, columns):
+        return _FakeDataset(self._df[columns])
+
+    def select(self, indices):
+        return _FakeDataset(self._df.iloc[list(indices)].reset_index(drop=True))
+
+    def to_pandas(self):
+        return self._df.copy()
+
+
+def _frame(n=20):
+    return pd.DataFrame({
+        "track_name": [f"song {i}" for i in range(n)],
+        "track_artist": [f"artist {i}" for i in range(n)],
+        "playlist_genre": ["rock"] * n,
+        "playlist_subgenre": ["indie"] * n,
+        "track_album_release_date": ["1994-05-01"] * n,
+        "energy": np.linspace(0, 1, n),
+        "valence": [0.5] * n,
+        "danceability": [0.5] * n,
+        "tempo": np.linspace(60, 180, n),
+        "unused": range(n),
+    })
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    loads = []
+
+    def load_dataset(name, split="train"):
+        loads.append(name)
+        return _FakeDataset(_frame())
+
+    monkeypatch.setattr(fetcher, "load_dataset", load_dataset)
+    return loads
+
+
+def _normalize(**columns):
+    return SpotifyDatasetFetcher(cache_dir=None)._normalize(pd.DataFrame(columns))
+
+
+class TestNormalize:
+    def test_missing_text_gets_defaults(self):
+        tracks = _normalize(
+            track_name=[None, "  Song  "],
+            track_artist=["", float("nan")],
+            playlist_genre=[None, ""],
+            playlist_subgenre=["indie", None],
+        )
+
+        assert [(t.title, t.artist) for t in tracks] == [("Unknown", "Unknown"), ("Song", "Unknown")]
+        assert [t.genre for t in tracks] == ["indie", "unknown"]
+        assert [t.tags for t in tracks] == [["indie"], []]
+
+    def test_missing_columns_use_defaults(self):
+        (track,) = _normalize(track_name=["Only a title"])
+
+        assert track == Track(title="Only a title", artist="Unknown", genre="unknown", tempo="medium")
+        assert (track.energy, track.valence, track.danceability, track.tempo_bpm) == (0.5, 0.5, 0.5, 120.0)
+        assert track.decade is None
+
+    def test_nan_numbers_use_defaults(self):
+        (track,) = _normalize(energy=[np.nan], valence=["bad"], tempo=[None])
+
+        assert (track.energy, track.valence, track.tempo_bpm) == (0.5, 0.5, 120.0)
+        assert track.tempo == "medium"
+
+    @pytest.mark.parametrize(
+        "release, decade",
+        [("1994-05-01", "1990s"), ("2010", "2010s"), ("2019-12", "2010s"), ("", None), (None, None), ("abcd", None), ("0000", None)],
+    )
+    def test_decade(self, release, decade):
+        (track,) = _normalize(track_album_release_date=[release])
+        assert track.decade == decade
+
+    @pytest.mark.parametrize(
+        "bpm, bucket",
+        [(0.0, "slow"), (89.99, "slow"), (90.0, "medium"), (139.99, "medium"), (140.0, "fast"), (250.0, "fast")],
+    )
+    def test_tempo_bucket_edges(self, bpm, bucket):
+        (track,) = _normalize(tempo=[bpm])
+        assert track.tempo == bucket
+        assert track.tempo_bpm == bpm
+
+    def test_values_are_plain_python_types(self):
+        (track,) = _normalize(track_album_release_date=["1994"], energy=[0.8], tempo=[100.0])
+
+        assert type(track.decade) is str
+        assert type(track.tempo) is str
+        assert type(track.energy) is float
+
+
+class TestLoadTracks:
+    def test_samples_are_seeded_and_cached(self, dataset, tmp_path):
+        first = SpotifyDatasetFetcher("a/b", cache_dir=tmp_path).load_tracks(n_samples=5, seed=1)
+        again = SpotifyDatasetFetcher("a/b", cache_dir=tmp_path).load_tracks(n_samples=5, seed=1)
+
+        assert len(first) == 5
+        assert again == first
+        assert dataset == ["a/b"]
+        assert [f.name for f in (tmp_path / "a__b").iterdir()] == [
+            f"tracks_v{fetcher._CACHE_VERSION}_5_1.json"
+        ]
+
+    def test_cache_round_trip_restores_derived_fields(self, dataset, tmp_path):
+        SpotifyDatasetFetcher("a/b", cache_dir=tmp_path).load_tracks(n_samples=3)
+
+        cached = SpotifyDatasetFetcher("a/b", cache_dir=tmp_path).load_tracks(n_samples=3)
+
+        assert all(t.genre_lc == "rock" for t in cached)
+
+    def test_different_seeds_use_different_cache_files(self, dataset, tmp_path):
+        loader = SpotifyDatasetFetcher("a/b", cache_dir=tmp_path)
+
+        loader.load_tracks(n_samples=5, seed=1)
+        loader.load_tracks(n_samples=5, seed=2)
+
+        assert len(list((tmp_path / "a__b").iterdir())) == 2
+
+    @pytest.mark.parametrize("content", [b'[{"title": "x", "art', b'[{"nope": 1}]', b'{"not": "a list"}'])
+    def test_corrupt_cache_is_rebuilt(self, dataset, tmp_path, content):
+        loader = SpotifyDatasetFetcher("a/b", cache_dir=tmp_path)
+        expected = loader.load_tracks(n_samples=4)
+        cache_file = loader._cache_file(4, 42)
+        cache_file.write_bytes(content)
+
+        assert SpotifyDatasetFetcher("a/b", cache_dir=tmp_path).load_tracks(n_samples=4) == expected
+        assert fetcher.jsonio.loads(cache_file.read_bytes())[0]["title"] == expected[0].title
+
+    def test_no_cache_dir_skips_cache(self, dataset, tmp_path):
+        loader = SpotifyDatasetFetcher("a/b", cache_dir=None)
+
+        loader.load_tracks(n_samples=2)
+        loader.load_tracks(n_samples=2)
+
+        assert dataset == ["a/b"]  # the dataset handle is still reused in-process
+        assert list(tmp_path.iterdir()) == []
+
+
+def test_track_store_columns():
+    tracks = [Track("a", "x", genre="Rock", tempo="fast", energy=0.9), Track("b", "y", tempo=None)]
+
+    store = TrackStore.from_tracks(tracks)
+
+    assert len(store) == 2
+    assert store.row(1) is tracks[1]
+    assert store.tempo_idx.tolist() == [2, -1]
+    assert store.genre_lc.tolist() == ["rock", ""]
+    assert math.isclose(store.energy[0], 0.9, rel_tol=1e-6)
@@ -0,0 +1,256 @@
+"""Tests for model clients, JSON extraction and the model manager"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.services.models import (
+    HuggingFaceClient,
+    ModelClientFactory,
+    ModelManager,
+    ModelResponse,
+    OllamaClient,
+    ensure_json,
+)
+
+
+class _FakeModelServer(BaseHTTPRequestHandler):
+    """Answers like the HF Inference API, or like Ollama's /api/generate (NDJSON, chunked)"""
+
+    protocol_version = "HTTP/1.1"
+    requests_seen: list = []
+    connections: set = set()
+    stall = 1.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests_seen.append((self.path, dict(self.headers), body))
+        self.connections.add(self.client_address)
+        if self.path.endswith("/slow"):
+            time.sleep(self.stall)
+        if self.path.endswith("/stall-mid-body"):
+            self._send_json(b'[{"generated_text": "{}"}]', flush_after=5)
+        elif self.path == "/api/generate":
+            self._send_ndjson([
+                {"response": '{"score": ', "done": False},
+                {"response": "7.5}", "done": False},
+                {"response": "", "done": True},
+            ])
+        else:
+            text = None if self.path.endswith("/null") else 'Sure: {"score": 9, "reason": "upbeat"}'
+            generation = [{"generated_text": text}]
+            if isinstance(body["inputs"], list):
+                generation = [generation for _ in body["inputs"]]
+            elif self.path.endswith("/big"):
+                # Trailing items the streamed reader never needs
+                generation += [{"generated_text": "x" * 1024} for _ in range(100)]
+            self._send_json(json.dumps(generation).encode())
+
+    def _send_json(self, reply, flush_after=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        if flush_after is not None:
+            self.wfile.write(reply[:flush_after])
+            self.wfile.flush()
+            time.sleep(self.stall)
+            reply = reply[flush_after:]
+        self.wfile.write(reply)
+
+    def _send_ndjson(self, chunks):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            line = (json.dumps(chunk) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def server():
+    _FakeModelServer.requests_seen = []
+    _FakeModelServer.connections = set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FakeModelServer)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class _StaticClient:
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    def generate_json(self, prompt, temperature=0.7, max_length=256):
+        self.calls += 1
+        return self.response
+
+
+class TestEnsureJson:
+    def test_plain_object(self):
+        assert ensure_json('  {"score": 8} ') == {"score": 8}
+
+    def test_fenced_block(self):
+        text = 'Here you go:\n```json\n{"rankings": [{"index": 0}]}\n```\nDone {x}'
+        assert ensure_json(text) == {"rankings": [{"index": 0}]}
+
+    def test_untagged_fence_after_non_json_fence(self):
+        text = '```python\nprint(1)\n```\n```\n{"score": 3}\n```'
+        assert ensure_json(text) == {"score": 3}
+
+    def test_braces_in_prose(self):
+        assert ensure_json('I think {"score": 6, "reason": "calm"} fits.') == {"score": 6, "reason": "calm"}
+
+    def test_key_value_fallback(self):
+        assert ensure_json('Score: 8.5, reason: "nice vibe"') == {"score": 8.5, "reason": "nice vibe"}
+
+    def test_non_json(self):
+        assert ensure_json("no structured output here") is None
+        assert ensure_json("[1, 2, 3]") is None
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize(
+        "text",
+        ["{" * 65536, "```{" * 16384, "```json\n{" * 7000, "score: " * 9000, "reason: " * 8000 + '"' + "x" * 1_000_000],
+        ids=["braces", "fences", "json-fences", "key-value", "over-cap"],
+    )
+    def test_worst_case_input_is_fast(self, text):
+        # Quadratic scans took 1.5-4.6s on 64 KB of these; linear ones take milliseconds,
+        # so the bound only has to tell the two apart, even on a loaded runner
+        start = time.perf_counter()
+        ensure_json(text)
+        assert time.perf_counter() - start < 1.0
+
+
+class TestClients:
+    def test_factory_creates_huggingface_client(self):
+        client = ModelClientFactory.create_client("huggingface", model_name="x", api_token="t")
+        assert isinstance(client, HuggingFaceClient)
+        assert client.base_url.endswith("/x")
+
+    def test_factory_rejects_unknown_type(self):
+        with pytest.raises(ValueError):
+            ModelClientFactory.create_client("nope", model_name="x")
+
+    def test_huggingface_round_trip(self, server, monkeypatch):
+        monkeypatch.setattr(HuggingFaceClient, "API_URL", f"{server}/models/")
+        client = ModelClientFactory.create_client("huggingface", model_name="x", api_token="t")
+
+        response = client.generate_json("rank these", temperature=0.3)
+
+        assert response == ModelResponse(success=True, data={"score": 9, "reason": "upbeat"})
+        path, headers, body = _FakeModelServer.requests_seen[0]
+        assert path == "/models/x"
+        assert headers["Authorization"] == "Bearer t"
+        assert body["inputs"] == "rank these"
+        assert body["parameters"]["temperature"] == 0.3
+
+    def test_huggingface_batch_is_one_request(self, server, monkeypatch):
+        monkeypatch.setattr(HuggingFaceClient, "API_URL", f"{server}/models/")
+        manager = ModelManager(HuggingFaceClient("x"))
+
+        responses = manager.generate_json_batch(["a", "b", "c"])
+
+        assert [r.data["score"] for r in responses] == [9, 9, 9]
+        assert len(_FakeModelServer.requests_seen) == 1
+        assert _FakeModelServer.requests_seen[0][2]["inputs"] == ["a", "b", "c"]
+
+    def test_read_timeout_is_not_replayed(self, server, monkeypatch):
+        monkeypatch.setattr(HuggingFaceClient, "API_URL", f"{server}/models/")
+        monkeypatch.setattr(HuggingFaceClient, "TIMEOUT", 0.2)
+        monkeypatch.setattr(_FakeModelServer, "stall", 0.5)
+
+        response = HuggingFaceClient("slow").generate_json("p")
+
+        assert not response.success
+        assert len(_FakeModelServer.requests_seen) == 1
+
+    def test_null_generated_text_is_a_failed_response(self, server, monkeypatch):
+        monkeypatch.setattr(HuggingFaceClient, "API_URL", f"{server}/models/")
+        client = HuggingFaceClient("null")
+        failed = ModelResponse(success=False, error="Response had no generated_text")
+
+        assert client.generate_many(["a", "b"]) == [failed, failed]
+        assert client.generate_json("a") == failed
+
+    def test_timeout_mid_body_is_a_failed_response(self, server, monkeypatch):
+        monkeypatch.setattr(HuggingFaceClient, "API_URL", f"{server}/models/")
+        monkeypatch.setattr(HuggingFaceClient, "TIMEOUT", 0.2)
+        monkeypatch.setattr(_FakeModelServer, "stall", 0.5)
+
+        response = HuggingFaceClient("stall-mid-body").generate_json("p")
+
+        assert not response.success
+        assert response.error
+
+    def test_large_body_keeps_connection_pooled(self, server, monkeypatch):
+        monkeypatch.setattr(HuggingFaceClient, "API_URL", f"{server}/models/")
+        client = HuggingFaceClient("big")
+
+        responses = [client.generate_json("p") for _ in range(3)]
+
+        assert all(r.data == {"score": 9, "reason": "upbeat"} for r in responses)
+        assert len(_FakeModelServer.connections) == 1
+
+    def test_ollama_streaming_round_trip(self, server):
+        client = OllamaClient("llama", base_url=server)
+        tokens = []
+
+        response = client.generate_json("rank these", on_token=tokens.append)
+
+        assert response == ModelResponse(success=True, data={"score": 7.5})
+        assert tokens == ['{"score": ', "7.5}"]
+        assert _FakeModelServer.requests_seen[0][2]["model"] == "llama"
+
+
+class _ShortBatchClient(_StaticClient):
+    def generate_many(self, prompts, temperature=0.7, max_length=256):
+        return [self.response] * (len(prompts) - 1)
+
+
+class TestModelManager:
+    def test_cache_hit_skips_client_and_is_not_shared(self):
+        primary = _StaticClient(ModelResponse(success=True, data={"rankings": [{"index": 0}]}))
+        manager = ModelManager(primary)
+
+        first = manager.generate_json("p")
+        first.data["rankings"].append({"index": 1})
+        second = manager.generate_json("p")
+
+        assert primary.calls == 1
+        assert second.data == {"rankings": [{"index": 0}]}
+        assert manager.cache_info()["hits"] == 1
+
+    def test_fallback_on_failure(self):
+        fallback = _StaticClient(ModelResponse(success=True, data={"score": 1}))
+        manager = ModelManager(_StaticClient(ModelResponse(success=False, error="down")), fallback)
+
+        assert manager.generate_json("p").data == {"score": 1}
+        assert fallback.calls == 1
+
+    def test_short_batch_fills_unserved_slots(self):
+        fallback = _StaticClient(ModelResponse(success=True, data={"score": 1}))
+        manager = ModelManager(_ShortBatchClient(ModelResponse(success=True, data={"score": 9})), fallback)
+
+        responses = manager.generate_json_batch(["a", "b", "c"])
+
+        assert [r.data["score"] for r in responses] == [9, 9, 1]
+        assert fallback.calls == 1
+
+    def test_short_batch_without_fallback_fails_cleanly(self):
+        manager = ModelManager(_ShortBatchClient(ModelResponse(success=True, data={"score": 9})))
+
+        responses = manager.generate_json_batch(["a", "b"])
+
+        assert [r.success for r in responses] == [True, False]
@@ -0,0 +1,148 @@
+"""Tests for base scoring and mapping AI rankings back to tracks"""
+
+import pytest
+
+from app.core.fetcher import Track, TrackStore
+from app.core.mood import MoodProfile
+from app.core.rank import (
+    PlaylistRanker,
+    RankedTrack,
+    _score_kernel_loop,
+    _score_kernel_numpy,
+)
+from app.services.models import ModelResponse
+
+
+class _FakeModelManager:
+    """Returns canned responses in prompt order and records the prompts"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def generate_json_batch(self, prompts, temperature=0.7, max_length=256):
+        self.prompts.extend(prompts)
+        return [self.responses.pop(0) for _ in prompts]
+
+
+def _mood(**overrides):
+    fields = {"energy": "high", "valence": "positive", "tempo": "fast", "genres": ("rock",), "keywords": (), "raw_text": "pumped"}
+    return MoodProfile(**{**fields, **overrides})
+
+
+def _candidates(n):
+    return [(Track(f"song {i}", "artist"), float(i)) for i in range(n)]
+
+
+def _rankings(*entries):
+    return ModelResponse(success=True, data={"rankings": list(entries)})
+
+
+class TestBaseScores:
+    def test_scores_each_matching_feature(self):
+        tracks = [
+            Track("all", "a", genre="Rock", tempo="fast", energy=0.9, valence=0.9),
+            Track("none", "a", genre="jazz", tempo="slow", energy=0.1, valence=0.1),
+            Track("genre", "a", genre="rock", tempo=None, energy=0.7, valence=0.6),
+        ]
+
+        scores = PlaylistRanker(_FakeModelManager())._calculate_scores(_mood(), TrackStore.from_tracks(tracks))
+
+        assert scores.tolist() == [9.0, 5.0, 6.0]
+
+    def test_numpy_and_loop_kernels_agree(self):
+        tracks = [Track(str(i), "a", genre="rock", tempo=t, energy=e, valence=v)
+                  for i, (t, e, v) in enumerate([("fast", 0.8, 0.2), ("slow", 0.71, 0.61), (None, 0.5, 0.9)])]
+        store = TrackStore.from_tracks(tracks)
+        args = (store.energy, store.valence, store.tempo_idx, store.genre_lc == "rock", True, True, 2)
+
+        assert _score_kernel_numpy(*args).tolist() == _score_kernel_loop(*args).tolist()
+
+
+class TestParseAiBatch:
+    def test_entries_map_by_index_not_position(self):
+        ranker = PlaylistRanker(_FakeModelManager())
+        candidates = _candidates(3)
+
+        ranked = ranker._parse_ai_batch(
+            [{"index": 2, "score": 9, "reason": "c"}, {"index": 0, "score": 7, "reason": "a"}], candidates
+        )
+
+        assert [(r.track.title, r.score, r.reason) for r in ranked] == [
+            ("song 0", 7.0, "a"),
+            ("song 1", 1.0, "Feature-based match"),
+            ("song 2", 9.0, "c"),
+        ]
+
+    def test_missing_index_falls_back_to_position(self):
+        ranked = PlaylistRanker(_FakeModelManager())._parse_ai_batch(
+            [{"score": 4}, {"index": "1", "score": 6}], _candidates(2)
+        )
+
+        assert [r.score for r in ranked] == [4.0, 6.0]
+
+    def test_first_entry_wins_on_duplicate_index(self):
+        ranked = PlaylistRanker(_FakeModelManager())._parse_ai_batch(
+            [{"index": 0, "score": 3}, {"index": 0, "score": 8}], _candidates(1)
+        )
+
+        assert ranked[0].score == 3.0
+
+    @pytest.mark.parametrize("entries", [None, "nonsense", [], ["not a dict"], [{"index": 5, "score": 9}]])
+    def test_unusable_entries_fall_back(self, entries):
+        ranked = PlaylistRanker(_FakeModelManager())._parse_ai_batch(entries, _candidates(2))
+
+        assert [(r.score, r.reason, tuple(r.match_factors)) for r in ranked] == [
+            (0.0, "Feature-based match", ("tempo", "energy")),
+            (1.0, "Feature-based match", ("tempo", "energy")),
+        ]
+
+
+class TestParseAiEntry:
+    @pytest.mark.parametrize("raw, expected", [(7.5, 7.5), ("8", 8.0), (42, 10.0), (-3, 0.0)])
+    def test_score_is_coerced_and_clamped(self, raw, expected):
+        track, base = _candidates(1)[0]
+
+        assert PlaylistRanker(_FakeModelManager())._parse_ai_entry({"score": raw}, track, base).score == expected
+
+    @pytest.mark.parametrize("raw", ["high", None, float("nan"), [1]])
+    def test_bad_score_falls_back_to_base(self, raw):
+        track, _ = _candidates(1)[0]
+
+        ranked = PlaylistRanker(_FakeModelManager())._parse_ai_entry({"score": raw}, track, 4.0)
+
+        assert ranked == RankedTrack(track, 4.0, "Feature-based match", ("tempo", "energy"))
+
+    def test_missing_fields_get_defaults(self):
+        track, _ = _candidates(1)[0]
+
+        ranked = PlaylistRanker(_FakeModelManager())._parse_ai_entry({"factors": ["mood", 3]}, track, 6.0)
+
+        assert (ranked.score, ranked.reason, tuple(ranked.match_factors)) == (6.0, "Matches your mood", ("compatibility",))
+
+
+class TestRankAndExplain:
+    def test_one_prompt_per_chunk_and_top_k_by_ai_score(self):
+        tracks = [Track(f"song {i}", "a", genre="rock", tempo="fast", energy=0.9, valence=0.9) for i in range(7)]
+        manager = _FakeModelManager(
+            _rankings(*({"index": i, "score": i, "reason": "ok"} for i in range(5))),
+            _rankings({"index": 0, "score": 10, "reason": "best"}, {"index": 1, "score": 0.5}),
+        )
+
+        ranked = PlaylistRanker(manager).rank_and_explain(_mood(), tracks, top_k=7)
+
+        assert len(manager.prompts) == 2
+        assert ranked[0].reason == "best"
+        assert [r.score for r in ranked] == sorted((r.score for r in ranked), reverse=True)
+        assert {r.track.title for r in ranked} == {t.title for t in tracks}
+
+    def test_failed_response_keeps_base_scores(self):
+        tracks = [Track("a", "x", genre="rock", tempo="fast", energy=0.9, valence=0.9), Track("b", "x")]
+        manager = _FakeModelManager(ModelResponse(success=False, error="down"))
+
+        ranked = PlaylistRanker(manager).rank_and_explain(_mood(), tracks, top_k=2)
+
+        assert [(r.track.title, r.score, r.reason) for r in ranked] == [
+            ("a", 9.0, "Feature-based match"),
+            ("b", 5.0, "Feature-based match"),
+        ]